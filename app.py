@@ -2,9 +2,21 @@ import streamlit as st
 import os
 import json
 import re
+import asyncio
+import threading
+import time
+import random
+import hashlib
+import concurrent.futures
+import math
+from collections import Counter, OrderedDict
+import numpy as np
+import httpx
+import tiktoken
 from dotenv import load_dotenv
-from openai import OpenAI
-from youtube_transcript_api import YouTubeTranscriptApi
+from openai import AsyncOpenAI, DefaultAioHttpClient, DEFAULT_CONNECTION_LIMITS
+import requests
+from youtube_transcript_api import YouTubeTranscriptApi, YouTubeRequestFailed, IpBlocked
 import logging
 
 # Load environment variables
@@ -18,8 +30,8 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS
-st.markdown("""
+# Custom CSS (chat bubbles use native st.chat_message, so only header/status styles remain)
+CSS = """
 <style>
     .main-header {
         font-size: 2.5rem;
@@ -31,32 +43,6 @@ st.markdown("""
         margin-bottom: 2rem;
     }
 
-    .chat-message {
-        padding: 1rem;
-        border-radius: 15px;
-        margin: 0.5rem 0;
-        animation: fadeIn 0.3s ease;
-    }
-
-    .user-message {
-        background: linear-gradient(135deg, #667eea, #764ba2);
-        color: white;
-        margin-left: 20%;
-        border-radius: 15px 15px 5px 15px;
-    }
-
-    .bot-message {
-        background: linear-gradient(135deg, #f093fb, #f5576c);
-        color: white;
-        margin-right: 20%;
-        border-radius: 15px 15px 15px 5px;
-    }
-
-    @keyframes fadeIn {
-        from { opacity: 0; transform: translateY(10px); }
-        to { opacity: 1; transform: translateY(0); }
-    }
-
     .status-box {
         padding: 1rem;
         border-radius: 10px;
@@ -82,170 +68,605 @@ st.markdown("""
         color: #721c24;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+# Streamlit drops elements a rerun doesn't emit, so the (small) style block is sent every run
+st.markdown(CSS, unsafe_allow_html=True)
+
+# YouTube URL formats, and a bare 11-character video ID
+_YT_PATTERNS = [
+    re.compile(r'(?:youtube\.com\/watch\?v=|youtu\.be\/|youtube\.com\/embed\/)([^&\n?#]+)'),
+    re.compile(r'youtube\.com\/watch\?.*v=([^&\n?#]+)')
+]
+_YT_ID = re.compile(r'^[a-zA-Z0-9_-]{11}$')
+
+# Attempts per transcript fetch; transient failures back off 0.5s, 1s, ... plus jitter
+TRANSCRIPT_FETCH_ATTEMPTS = 3
+
+# Transcript characters sent to the personality analysis, shared across all videos
+ANALYSIS_TRANSCRIPT_CHARS = 6000
+SPEECH_SAMPLE_CHARS = 2000
+
+# Transcripts are split into ~200-token chunks and clustered into this many speaking modes
+TRANSCRIPT_CHUNK_CHARS = 800
+REPRESENTATIVE_CHUNKS = 8
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Token budget for conversation history replayed to the model
+HISTORY_TOKEN_BUDGET = 2000
+CHARS_PER_TOKEN = 4  # rough estimate used when the tokenizer can't be loaded
+
+# Per-video personality analyses run concurrently, then get merged into one profile
+ANALYSIS_MODEL = "gpt-4o-mini"
+ANALYSIS_CONCURRENCY = 8
+
+# Local personality analysis: phrases and quotes surfaced in the system prompt
+COMMON_PHRASES = 15
+REPRESENTATIVE_SENTENCES = 8
+SENTENCE_MAX_WORDS = 40
+STOPWORDS = frozenset("""
+a about after all also am an and any are as at be because been but by can could did do does
+for from had has have he her him his how i if in into is it its just me my no not of on or our
+out over she so than that the their them then there these they this to too up us was we were
+what when where which who will with would you your
+""".split())
+_WORD = re.compile(r"[a-z0-9']+")
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+# Chat models offered in the sidebar; the first is the default
+CHAT_MODELS = ["gpt-4o-mini", "gpt-4.1-mini", "gpt-4o", "gpt-4.1", "gpt-4"]
+
+# Cosine similarity above which a cached reply is reused for a new message
+SEMANTIC_CACHE_THRESHOLD = 0.95
+
+# Likely follow-ups answered ahead of time, while the user reads the reply and types
+FOLLOW_UP_PROMPTS = [
+    "Can you explain that in more detail?",
+    "Can you give me an example?",
+    "Can you say that in simpler terms?"
+]
+PREFETCH_MODEL = "gpt-4o-mini"
+PREFETCH_CONCURRENCY = 2
+
+# Exact-match completion cache: entries kept, and the highest temperature worth caching
+RESPONSE_CACHE_SIZE = 256
+RESPONSE_CACHE_MAX_TEMPERATURE = 0.5
+
+# openai's default pool sizes, but idle connections kept warm for 30s between chat turns
+HTTP_LIMITS = httpx.Limits(
+    max_connections=DEFAULT_CONNECTION_LIMITS.max_connections,
+    max_keepalive_connections=DEFAULT_CONNECTION_LIMITS.max_keepalive_connections,
+    keepalive_expiry=30
+)
+
+@st.cache_resource
+def get_event_loop():
+    """Long-lived event loop shared by all sessions for async OpenAI calls"""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+@st.cache_resource
+def get_openai_client(api_key):
+    """Single OpenAI client per API key, so its connection pool survives reruns"""
+    # aiohttp transport avoids httpx's async throughput issues (HTTP/1.1 only)
+    return AsyncOpenAI(api_key=api_key, http_client=DefaultAioHttpClient(limits=HTTP_LIMITS))
+
+@st.cache_resource
+def get_response_cache():
+    """LRU of completions keyed by request hash, shared across reruns"""
+    # Only touched from the event loop thread, so no locking is needed
+    return OrderedDict()
+
+@st.cache_data(persist="disk", show_spinner=False)
+def _fetch_transcript(video_id):
+    """Fetch a video's transcript text, persisted on disk so repeat runs skip YouTube"""
+    api = YouTubeTranscriptApi()
+    for attempt in range(TRANSCRIPT_FETCH_ATTEMPTS):
+        try:
+            transcript = api.fetch(video_id)
+            return " ".join([snippet.text for snippet in transcript])
+        except (YouTubeRequestFailed, IpBlocked, requests.ConnectionError, requests.Timeout):
+            # Only transient request failures are retried (rate limiting, HTTP 429, surfaces as
+            # IpBlocked); disabled/missing transcripts, invalid IDs and bugs are raised straight away
+            if attempt == TRANSCRIPT_FETCH_ATTEMPTS - 1:
+                raise
+            time.sleep(0.5 * 2 ** attempt + random.random())
+
+@st.cache_data(persist="disk", show_spinner=False)
+def _embed_chunks(video_id, chunks, _bot):
+    """Embed a video's transcript chunks, persisted on disk by video ID"""
+    return _bot.run(_bot.embed_batch(chunks))
+
+def split_into_chunks(text, size=TRANSCRIPT_CHUNK_CHARS):
+    """Split text into chunks of roughly `size` characters on word boundaries"""
+    chunks, words, length = [], [], 0
+
+    for word in text.split():
+        words.append(word)
+        length += len(word) + 1
+        if length >= size:
+            chunks.append(" ".join(words))
+            words, length = [], 0
+
+    if words:
+        chunks.append(" ".join(words))
+
+    return chunks
+
+def select_representative_chunks(chunks, embeddings, k=REPRESENTATIVE_CHUNKS, iterations=10):
+    """Cluster unit-length chunk embeddings and return the chunk nearest each centroid"""
+    if len(chunks) <= k:
+        return chunks
+
+    # Spherical k-means: with normalized vectors, the dot product is cosine similarity
+    rng = np.random.default_rng(0)
+    centroids = embeddings[rng.choice(len(chunks), k, replace=False)]
+
+    for _ in range(iterations):
+        labels = np.argmax(embeddings @ centroids.T, axis=1)
+        for c in range(k):
+            members = embeddings[labels == c]
+            if len(members):
+                centroid = members.mean(axis=0)
+                centroids[c] = centroid / np.linalg.norm(centroid)
+
+    # Keep the medoids in transcript order so the payload reads naturally
+    medoids = {int(np.argmax(embeddings @ centroid)) for centroid in centroids}
+    return [chunks[i] for i in sorted(medoids)]
+
+def common_phrases(text, top_k=COMMON_PHRASES):
+    """Most frequent repeated bigrams and trigrams that aren't made up entirely of stopwords"""
+    counts = Counter()
+
+    # Count within sentences so a phrase never spans one sentence's end and the next one's start
+    for sentence in _SENTENCE_END.split(text.lower()):
+        words = _WORD.findall(sentence)
+        for n in (2, 3):
+            for i in range(len(words) - n + 1):
+                gram = words[i:i + n]
+                if not all(word in STOPWORDS for word in gram):
+                    counts[" ".join(gram)] += 1
+
+    return [(phrase, count) for phrase, count in counts.most_common(top_k) if count > 1]
+
+def representative_sentences(text, k=REPRESENTATIVE_SENTENCES):
+    """Pick the sentences with the highest total TF-IDF weight, in their original order"""
+    # Auto-generated captions are often unpunctuated, so long runs are split into windows
+    sentences = []
+    for sentence in _SENTENCE_END.split(text):
+        words = sentence.split()
+        for i in range(0, len(words), SENTENCE_MAX_WORDS):
+            sentences.append(" ".join(words[i:i + SENTENCE_MAX_WORDS]))
+    sentences = list(dict.fromkeys(sentences))  # drop repeated lines, keeping order
+
+    tokenized = [[w for w in _WORD.findall(s.lower()) if w not in STOPWORDS] for s in sentences]
+    document_frequency = Counter(word for tokens in tokenized for word in set(tokens))
+
+    def score(i):
+        tf = Counter(tokenized[i])
+        return sum(count * math.log(len(sentences) / document_frequency[word]) for word, count in tf.items())
+
+    best = sorted(range(len(sentences)), key=score, reverse=True)[:k]
+    return [sentences[i] for i in sorted(best)]
+
+@st.cache_resource(show_spinner=False)
+def get_encoding():
+    """Tokenizer for counting history tokens, loaded on first use"""
+    # The first load downloads the BPE file, so it must not run at import time; a failed
+    # load raises instead of returning, so it isn't cached and gets retried on the next call
+    return tiktoken.encoding_for_model("gpt-4o-mini")
+
+def count_tokens(text):
+    """Count tokens with tiktoken, or estimate them from length if it's unavailable"""
+    try:
+        encoding = get_encoding()
+    except Exception as e:
+        logging.warning(f"Error loading tokenizer, estimating tokens from length: {str(e)}")
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text))
+
+def trim_history(messages, budget=HISTORY_TOKEN_BUDGET):
+    """Keep the most recent messages whose combined content fits in the token budget"""
+    kept, used = [], 0
+
+    for msg in reversed(messages):
+        used += count_tokens(msg["content"])
+        if used > budget:
+            break
+        kept.append(msg)
+
+    kept.reverse()
+    return kept
 
 class PersonalityBot:
     def __init__(self):
         self.client = None
+        self.loop = None
         self.personality_prompt = ""
         self.is_initialized = False
+        self.chat_model = CHAT_MODELS[0]
+        self.last_response_id = None  # server-side conversation state for the Responses API
+        # (normalized embedding, personality hash, conversation context, response, response ID);
+        # an entry only applies in the conversation state it was answered in
+        self.semantic_cache = []
+        self.follow_up_embeddings = None
+        self.prefetch_semaphore = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+        self.prefetch_tasks = set()
+        self.response_cache = OrderedDict()
 
         # Initialize OpenAI client
         api_key = os.getenv('OPENAI_API_KEY')
         if api_key:
-            self.client = OpenAI(api_key=api_key)
+            # The aiohttp session binds to the loop it first runs on, so every call
+            # goes through one long-lived loop rather than a fresh asyncio.run()
+            self.loop = get_event_loop()
+            self.client = get_openai_client(api_key)
+            self.response_cache = get_response_cache()
+
+    def run(self, coro):
+        """Run a coroutine on the bot's event loop and wait for the result"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def stream(self, agen):
+        """Iterate an async generator on the bot's event loop from synchronous code"""
+        async def next_item():
+            return await agen.__anext__()
+
+        while True:
+            try:
+                yield self.run(next_item())
+            except StopAsyncIteration:
+                return
+
+    async def create_completion(self, messages, model, max_tokens, temperature):
+        """Get a completion's text, reusing the result of an identical low-temperature request"""
+        cacheable = temperature <= RESPONSE_CACHE_MAX_TEMPERATURE
+        request = {"messages": messages, "model": model, "max_tokens": max_tokens, "temperature": temperature}
+        key = hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+        if cacheable and key in self.response_cache:
+            self.response_cache.move_to_end(key)
+            return self.response_cache[key]
+
+        response = await self.client.chat.completions.create(**request)
+        content = response.choices[0].message.content
+
+        if cacheable:
+            self.response_cache[key] = content
+            if len(self.response_cache) > RESPONSE_CACHE_SIZE:
+                self.response_cache.popitem(last=False)
+        return content
 
     def extract_video_id(self, url):
         """Extract video ID from various YouTube URL formats"""
-        patterns = [
-            r'(?:youtube\.com\/watch\?v=|youtu\.be\/|youtube\.com\/embed\/)([^&\n?#]+)',
-            r'youtube\.com\/watch\?.*v=([^&\n?#]+)'
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, url)
+        for pattern in _YT_PATTERNS:
+            match = pattern.search(url)
             if match:
                 return match.group(1)
 
         # If it's already just the video ID
-        if re.match(r'^[a-zA-Z0-9_-]{11}$', url):
+        if _YT_ID.match(url):
             return url
 
         raise ValueError("Invalid YouTube URL or video ID")
 
-    def get_transcript(self, video_url_or_id):
-        """Get transcript from a single video"""
-        try:
-            video_id = self.extract_video_id(video_url_or_id)
-            transcript = YouTubeTranscriptApi.get_transcript(video_id)
-            return " ".join([entry["text"] for entry in transcript])
-        except Exception as e:
-            st.error(f"Error getting transcript for {video_url_or_id}: {str(e)}")
-            return None
-
-    def analyze_personality(self, transcripts_text, person_name):
-        """Create personality prompt from transcripts"""
-        analysis_prompt = f"""
-        Analyze the following transcripts from {person_name}'s YouTube videos and create a personality profile for an AI chatbot.
-
-        Focus on:
-        1. Speaking style and tone
-        2. Common phrases and expressions
-        3. How they explain concepts
-        4. Their personality traits and humor
-        5. Technical knowledge level
-        6. Communication patterns
-
-        Transcripts:
-        {transcripts_text[:6000]}
-
-        Create a detailed system prompt that will make an AI assistant respond exactly like {person_name}.
-        """
-
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[{"role": "user", "content": analysis_prompt}],
-                max_tokens=1000,
-                temperature=0.3
-            )
-
-            personality_analysis = response.choices[0].message.content
-
-            # Create the final system prompt
-            system_prompt = f"""
-You are an AI assistant that perfectly mimics {person_name}'s personality and communication style based on their YouTube content.
-
-PERSONALITY ANALYSIS:
-{personality_analysis}
-
-COMMUNICATION GUIDELINES:
-- Respond exactly as {person_name} would
-- Use their typical expressions and speaking style
-- Match their energy level and tone
-- Explain things the way they do
-- Include their characteristic humor and personality quirks
-- Stay true to their areas of expertise
-
-SAMPLE SPEECH PATTERNS FROM TRANSCRIPTS:
-{transcripts_text[:2000]}
-
-Always maintain {person_name}'s authentic voice while being helpful and engaging.
-"""
-
-            return system_prompt
-
-        except Exception as e:
-            st.error(f"Error analyzing personality: {str(e)}")
-            return None
+    def load_video(self, video_url_or_id):
+        """Get a video's transcript plus its chunks and their embeddings (runs in a worker thread)"""
+        video_id = self.extract_video_id(video_url_or_id)
+        transcript = _fetch_transcript(video_id)
+        chunks = split_into_chunks(transcript)
+
+        # Embeddings only refine which samples get analyzed, so a failure isn't fatal
+        embeddings = None
+        if chunks:
+            try:
+                embeddings = _embed_chunks(video_id, chunks, self)
+            except Exception as e:
+                logging.warning(f"Error embedding transcript for {video_url_or_id}: {str(e)}")
+
+        return transcript, chunks, embeddings
+
+    async def analyze_personality(self, video_samples, person_name, sample_text):
+        """Create personality prompt from per-video model analyses plus local phrase statistics"""
+        semaphore = asyncio.Semaphore(ANALYSIS_CONCURRENCY)
+
+        async def analyze_one(sample):
+            analysis_prompt = f"""
+            Analyze these representative excerpts from one of {person_name}'s YouTube videos and describe, in under 200 words:
+            speaking style and tone, common phrases, how they explain concepts, personality traits and humor,
+            technical knowledge level, and communication patterns.
+
+            Excerpts:
+            {sample}
+            """
+            async with semaphore:
+                return await self.create_completion(
+                    model=ANALYSIS_MODEL,
+                    messages=[{"role": "user", "content": analysis_prompt}],
+                    max_tokens=400,
+                    temperature=0.3
+                )
+
+        # One round trip for all videos instead of one per video
+        results = await asyncio.gather(*[analyze_one(sample) for sample in video_samples], return_exceptions=True)
+        analyses = []
+        for result in results:
+            if isinstance(result, Exception):
+                logging.warning(f"Error analyzing video: {str(result)}")
+            else:
+                analyses.append(result)
+
+        personality_analysis = analyses[0] if len(analyses) == 1 else None
+        if len(analyses) > 1:
+            notes = "\n\n".join(f"Video {i + 1}:\n{analysis}" for i, analysis in enumerate(analyses))
+            merge_prompt = f"""
+            Merge these per-video notes about {person_name} into one concise personality profile for an AI chatbot,
+            keeping traits that recur and dropping video-specific details.
+
+            {notes}
+            """
+            try:
+                personality_analysis = await self.create_completion(
+                    model=ANALYSIS_MODEL,
+                    messages=[{"role": "user", "content": merge_prompt}],
+                    max_tokens=1000,
+                    temperature=0.3
+                )
+            except Exception as e:
+                logging.warning(f"Error merging video analyses: {str(e)}")
+                personality_analysis = notes
+
+        return self.build_system_prompt(sample_text, person_name, personality_analysis)
+
+    def build_system_prompt(self, transcripts_text, person_name, personality_analysis=None):
+        """Assemble the system prompt, with local phrase statistics and an optional model analysis"""
+        # Slice once; the speech sample comes from the already-short head
+        analysis_text = transcripts_text[:ANALYSIS_TRANSCRIPT_CHARS]
+        speech_sample = analysis_text[:SPEECH_SAMPLE_CHARS]
+
+        phrases = [f"- \"{phrase}\" ({count}x)" for phrase, count in common_phrases(analysis_text)]
+        quotes = [f"- \"{sentence}\"" for sentence in representative_sentences(analysis_text)]
+
+        # Create the final system prompt
+        system_prompt = "\n".join([
+            "",
+            f"You are an AI assistant that perfectly mimics {person_name}'s personality and communication style based on their YouTube content.",
+            "",
+            *(["PERSONALITY ANALYSIS:", personality_analysis, ""] if personality_analysis else []),
+            "COMMON PHRASES AND EXPRESSIONS:",
+            *(phrases or ["- (none stood out)"]),
+            "",
+            "REPRESENTATIVE QUOTES:",
+            *quotes,
+            "",
+            "COMMUNICATION GUIDELINES:",
+            f"- Respond exactly as {person_name} would",
+            "- Use their typical expressions and speaking style",
+            "- Match their energy level and tone",
+            "- Explain things the way they do",
+            "- Include their characteristic humor and personality quirks",
+            "- Stay true to their areas of expertise",
+            "",
+            "SAMPLE SPEECH PATTERNS FROM TRANSCRIPTS:",
+            speech_sample,
+            "",
+            f"Always maintain {person_name}'s authentic voice while being helpful and engaging.",
+            ""
+        ])
+
+        return system_prompt
 
     def initialize(self, video_urls, person_name):
         """Initialize the bot with personality from videos"""
         if not self.client:
             return False, "OpenAI API key not found. Please check your .env file."
 
-        # Get transcripts from all videos
-        all_transcripts = []
+        # Get transcripts from all videos concurrently (network-bound)
+        videos = [None] * len(video_urls)
         successful_videos = 0
 
         progress_bar = st.progress(0)
         status_text = st.empty()
+        status_text.text(f"Fetching {len(video_urls)} transcript(s)...")
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(16, len(video_urls))) as executor:
+            futures = {executor.submit(self.load_video, url): i for i, url in enumerate(video_urls)}
+
+            for done, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+                i = futures[future]
+                status_text.text(f"Processed video {done}/{len(video_urls)}...")
+                progress_bar.progress(done / len(video_urls))
 
-        for i, url in enumerate(video_urls):
-            status_text.text(f"Processing video {i+1}/{len(video_urls)}...")
-            progress_bar.progress((i) / len(video_urls))
+                # Report failures per video so one bad URL doesn't sink the batch
+                try:
+                    videos[i] = future.result()
+                except Exception as e:
+                    st.error(f"Error getting transcript for {video_urls[i]}: {str(e)}")
+                    continue
 
-            transcript = self.get_transcript(url)
-            if transcript:
-                all_transcripts.append(transcript)
-                successful_videos += 1
+                if videos[i][0]:
+                    successful_videos += 1
+
+        # Keep the original video order regardless of completion order
+        videos = [video for video in videos if video and video[0]]
 
         progress_bar.progress(1.0)
         status_text.text("Analyzing personality...")
 
-        if not all_transcripts:
+        if not videos:
             return False, "No transcripts could be extracted from the provided videos."
 
-        # Combine all transcripts
-        combined_transcripts = " ".join(all_transcripts)
+        # Sample each video by the chunks that best represent its speaking modes,
+        # splitting one analysis budget across videos so every video contributes
+        chunks_per_video = max(1, REPRESENTATIVE_CHUNKS // len(videos))
+        per_video_budget = ANALYSIS_TRANSCRIPT_CHARS // len(videos)
+        video_samples = []
+        for transcript, chunks, embeddings in videos:
+            if embeddings is not None:
+                video_samples.append(" ".join(select_representative_chunks(chunks, embeddings, k=chunks_per_video)))
+            else:
+                # No embeddings for this video: fall back to its opening share of the budget
+                video_samples.append(transcript[:per_video_budget])
+        combined_transcripts = " ".join(video_samples)
 
-        # Analyze personality
-        self.personality_prompt = self.analyze_personality(combined_transcripts, person_name)
+        # Analyze personality (errors are shown here, on the script thread)
+        try:
+            self.personality_prompt = self.run(self.analyze_personality(video_samples, person_name, combined_transcripts))
+        except Exception as e:
+            st.error(f"Error analyzing personality: {str(e)}")
+            self.personality_prompt = None
 
         if self.personality_prompt:
             self.is_initialized = True
+            self.last_response_id = None
             status_text.text("✅ Personality analysis complete!")
             return True, f"Successfully initialized with {successful_videos} videos!"
         else:
             return False, "Failed to analyze personality."
 
-    def chat(self, message, conversation_history):
-        """Chat with the personality bot"""
+    async def embed_batch(self, texts):
+        """Embed many texts in one request as unit-length rows, so cosine similarity is a dot product"""
+        response = await self.client.embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=texts
+        )
+        embeddings = np.array([item.embedding for item in response.data])
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    async def embed(self, text):
+        """Get a unit-length embedding for a single text"""
+        return (await self.embed_batch([text]))[0]
+
+    def lookup_semantic_cache(self, embedding, personality_hash, context):
+        """Return (response, response ID) for the most similar message asked in the same context"""
+        best_similarity, best_entry = SEMANTIC_CACHE_THRESHOLD, None
+
+        for cached_embedding, cached_hash, cached_context, response, response_id in self.semantic_cache:
+            if cached_hash != personality_hash or cached_context != context:
+                continue
+
+            similarity = float(np.dot(embedding, cached_embedding))
+            if similarity > best_similarity:
+                best_similarity, best_entry = similarity, (response, response_id)
+
+        return best_entry
+
+    def prune_semantic_cache(self):
+        """Drop entries tied to an earlier reply; the thread only moves forward, so they can't match again"""
+        self.semantic_cache = [
+            entry for entry in self.semantic_cache
+            if entry[2].startswith("history:") or entry[2] == self.last_response_id
+        ]
+
+    async def prefetch_follow_ups(self, personality_hash, context_id):
+        """Answer likely follow-up questions to a reply and add them to the semantic cache"""
+        if self.follow_up_embeddings is None:
+            self.follow_up_embeddings = await self.embed_batch(FOLLOW_UP_PROMPTS)
+
+        async def answer(prompt, embedding):
+            async with self.prefetch_semaphore:
+                response = await self.client.responses.create(
+                    model=PREFETCH_MODEL,
+                    instructions=self.personality_prompt,
+                    input=[{"role": "user", "content": prompt}],
+                    previous_response_id=context_id,
+                    max_output_tokens=500,
+                    temperature=0.7
+                )
+            # Cache mutations all happen on the event loop thread, so no lock is needed;
+            # skip answers that arrive after the conversation has already moved on
+            if context_id == self.last_response_id:
+                self.semantic_cache.append((embedding, personality_hash, context_id, response.output_text, response.id))
+
+        results = await asyncio.gather(
+            *[answer(prompt, embedding) for prompt, embedding in zip(FOLLOW_UP_PROMPTS, self.follow_up_embeddings)],
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logging.warning(f"Error prefetching follow-up: {str(result)}")
+
+    async def chat(self, message, conversation_history):
+        """Chat with the personality bot, yielding the reply as it is generated"""
         if not self.is_initialized or not self.client:
-            return "Bot not initialized. Please set up the personality first."
+            yield "Bot not initialized. Please set up the personality first."
+            return
 
-        # Prepare messages
-        messages = [{"role": "system", "content": self.personality_prompt}]
+        # The server keeps earlier turns once a response ID exists, so only the
+        # new message is sent; history is replayed only to start a fresh thread
+        messages = []
 
-        # Add conversation history (last 10 messages)
-        for msg in conversation_history[-10:]:
-            messages.append(msg)
+        if self.last_response_id:
+            context = self.last_response_id
+        else:
+            # Add conversation history (as much as fits in the token budget)
+            messages.extend(trim_history(conversation_history))
+            context = "history:" + hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).hexdigest()
 
         # Add current message
         messages.append({"role": "user", "content": message})
 
+        # Paraphrased repeats in the same conversation state are answered from the
+        # cache without a model call; keying by personality keeps bots apart
+        personality_hash = hashlib.sha256(self.personality_prompt.encode()).hexdigest()
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=messages,
-                max_tokens=500,
-                temperature=0.7
-            )
+            embedding = await self.embed(message)
+        except Exception as e:
+            logging.warning(f"Error embedding message, skipping semantic cache: {str(e)}")
+            embedding = None
+
+        if embedding is not None:
+            cached = self.lookup_semantic_cache(embedding, personality_hash, context)
+            if cached is not None:
+                cached_response, cached_response_id = cached
+                # Every cached answer is a stored response from this same state,
+                # so the server-side thread continues from it
+                self.last_response_id = cached_response_id
+                self.prune_semantic_cache()
+                yield cached_response
+                return
 
-            return response.choices[0].message.content
+        try:
+            parts = []
+            response_id = None
+            input_tokens = 0
+            stream = await self.client.responses.create(
+                model=self.chat_model,
+                instructions=self.personality_prompt,
+                input=messages,
+                previous_response_id=self.last_response_id,
+                max_output_tokens=500,
+                temperature=0.7,
+                stream=True
+            )
+            async for event in stream:
+                if event.type == "response.output_text.delta":
+                    parts.append(event.delta)
+                    yield event.delta
+                elif event.type == "response.completed":
+                    response_id = event.response.id
+                    usage = event.response.usage
+                    input_tokens = usage.input_tokens if usage else 0
+
+            if response_id and input_tokens > HISTORY_TOKEN_BUDGET + count_tokens(self.personality_prompt):
+                # The chained thread has outgrown the history budget; start a fresh one next turn
+                # from the trimmed history instead of carrying the whole conversation forward
+                self.last_response_id = None
+                self.prune_semantic_cache()
+            elif response_id:
+                self.last_response_id = response_id
+                self.prune_semantic_cache()
+                if embedding is not None:
+                    self.semantic_cache.append((embedding, personality_hash, context, "".join(parts), response_id))
+
+                # Fire and forget; keep a reference so the task isn't garbage collected
+                task = asyncio.ensure_future(self.prefetch_follow_ups(personality_hash, response_id))
+                self.prefetch_tasks.add(task)
+                task.add_done_callback(self.prefetch_tasks.discard)
 
         except Exception as e:
-            return f"Error: {str(e)}"
+            yield f"Error: {str(e)}"
 
 # Initialize session state
 if 'bot' not in st.session_state:
@@ -300,6 +721,15 @@ with st.sidebar:
 
     st.markdown("---")
 
+    # Model used for chat
+    model = st.selectbox(
+        "Model",
+        CHAT_MODELS,
+        index=CHAT_MODELS.index(st.session_state.bot.chat_model),
+        help="Smaller models respond much faster; larger ones may mimic more closely"
+    )
+    st.session_state.bot.chat_model = model
+
     # Person name
     person_name = st.text_input(
         "Person's Name",
@@ -345,51 +775,34 @@ with col1:
     st.header("💬 Chat")
 
 with col2:
-    if st.session_state.messages:
-        if st.button("🗑️ Clear Chat"):
-            st.session_state.messages = []
-            st.rerun()
+    # Filled in after the chat input is handled, so it appears with the first message
+    clear_chat_placeholder = st.empty()
 
 if st.session_state.bot.is_initialized:
     # Display messages
-    chat_container = st.container()
-
-    with chat_container:
-        for message in st.session_state.messages:
-            if message["role"] == "user":
-                st.markdown(f"""
-                <div class="chat-message user-message">
-                    <strong>You:</strong> {message["content"]}
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                st.markdown(f"""
-                <div class="chat-message bot-message">
-                    <strong>{st.session_state.person_name}:</strong> {message["content"]}
-                </div>
-                """, unsafe_allow_html=True)
-
-    # Chat input
-    with st.form("chat_form", clear_on_submit=True):
-        user_input = st.text_area(
-            "Your message:",
-            placeholder=f"Ask {st.session_state.person_name} anything...",
-            height=100,
-            key="user_message"
-        )
-
-        submitted = st.form_submit_button("📤 Send", type="primary")
+    for message in st.session_state.messages:
+        if message["role"] == "user":
+            with st.chat_message("user"):
+                st.markdown(message["content"])
+        else:
+            with st.chat_message(st.session_state.person_name, avatar="🤖"):
+                st.markdown(f"**{st.session_state.person_name}**")
+                st.markdown(message["content"])
 
-        if submitted and user_input.strip():
-            # Add user message
-            st.session_state.messages.append({"role": "user", "content": user_input})
+    # Chat input; new messages render in place, so no st.rerun() is needed
+    if user_input := st.chat_input(f"Ask {st.session_state.person_name} anything..."):
+        with st.chat_message("user"):
+            st.markdown(user_input)
 
-            # Get bot response
-            with st.spinner(f"{st.session_state.person_name} is thinking..."):
-                bot_response = st.session_state.bot.chat(user_input, st.session_state.messages[:-1])
-                st.session_state.messages.append({"role": "assistant", "content": bot_response})
+        # Get bot response, rendering tokens as they arrive; the history is passed
+        # as-is (no copy) and the turn is only recorded once the reply is done
+        with st.chat_message(st.session_state.person_name, avatar="🤖"):
+            st.markdown(f"**{st.session_state.person_name}**")
+            bot = st.session_state.bot
+            bot_response = st.write_stream(bot.stream(bot.chat(user_input, st.session_state.messages)))
 
-            st.rerun()
+        st.session_state.messages.append({"role": "user", "content": user_input})
+        st.session_state.messages.append({"role": "assistant", "content": bot_response})
 
     # Show tips
     if not st.session_state.messages:
@@ -412,10 +825,16 @@ else:
     - Choose recent videos that showcase their typical style
     """)
 
+if st.session_state.messages:
+    if clear_chat_placeholder.button("🗑️ Clear Chat"):
+        st.session_state.messages = []
+        st.session_state.bot.last_response_id = None
+        st.rerun()
+
 # Footer
 st.markdown("---")
 st.markdown("""
 <div style="text-align: center; color: #666; padding: 1rem;">
-    Built with ❤️ using Streamlit and OpenAI GPT-4<br>
+    Built with ❤️ using Streamlit and OpenAI<br>
 </div>
 """, unsafe_allow_html=True)